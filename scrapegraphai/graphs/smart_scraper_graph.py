@@ -13,6 +13,16 @@ from ..nodes import (
     GenerateAnswerNode
 )
 
+# nodes of the pipeline, in execution order, for each (html_mode, reasoning)
+# setting, the flags only count when set explicitly, any other setting
+# fetches, parses and answers
+_GRAPH_SHAPES = {
+    (False, True): ("fetch", "parse", "reasoning", "generate_answer"),
+    (True, True): ("fetch", "reasoning", "generate_answer"),
+    (True, False): ("fetch", "generate_answer"),
+}
+_DEFAULT_GRAPH_SHAPE = ("fetch", "parse", "generate_answer")
+
 class SmartScraperGraph(AbstractGraph):
     """
     SmartScraper is a scraping pipeline that automates the process of 
@@ -47,6 +57,21 @@ class SmartScraperGraph(AbstractGraph):
     """
 
     def __init__(self, prompt: str, source: str, config: dict, schema: Optional[BaseModel] = None):
+        # read before super().__init__, which creates the graph
+        self._force = config.get("force", False)
+        self._cut = config.get("cut", True)
+        self._additional_info = config.get("additional_info")
+        self._html_mode = config.get("html_mode")
+        self._reasoning = config.get("reasoning")
+        self._answer_options = {
+            "max_concurrency": config.get("max_concurrency"),
+            "marshal_size": config.get("marshal_size"),
+            "merge_strategy": config.get("merge_strategy"),
+            "use_batch_api": config.get("use_batch_api", False),
+            "batch_api_threshold": config.get("batch_api_threshold"),
+            "max_chunk_chars": config.get("max_chunk_chars"),
+        }
+
         super().__init__(prompt, config, source, schema)
 
         self.input_key = "url" if source.startswith("http") else "local_dir"
@@ -58,40 +83,35 @@ class SmartScraperGraph(AbstractGraph):
         Returns:
             BaseGraph: A graph instance representing the web scraping workflow.
         """
+        shape = _GRAPH_SHAPES.get((self._html_mode, self._reasoning), _DEFAULT_GRAPH_SHAPE)
 
-        fetch_node = FetchNode(
-            input="url| local_dir",
-            output=["doc"],
-            node_config={
-                "llm_model": self.llm_model,
-                "force": self.config.get("force", False),
-                "cut": self.config.get("cut", True),
-                "loader_kwargs": self.config.get("loader_kwargs", {}),
-                "browser_base": self.config.get("browser_base"),
-                "scrape_do": self.config.get("scrape_do")
-            }
-        )
-        parse_node = ParseNode(
-            input="doc",
-            output=["parsed_doc"],
-            node_config={
-                "llm_model": self.llm_model,
-                "chunk_size": self.model_token
-            }
-        )
-
-        generate_answer_node = GenerateAnswerNode(
-            input="user_prompt & (relevant_chunks | parsed_doc | doc)",
-            output=["answer"],
-            node_config={
-                "llm_model": self.llm_model,
-                "additional_info": self.config.get("additional_info"),
-                "schema": self.schema,
-            }
-        )
+        nodes = {
+            "fetch": FetchNode(
+                input="url| local_dir",
+                output=["doc"],
+                node_config={
+                    "llm_model": self.llm_model,
+                    "force": self._force,
+                    "cut": self._cut,
+                    "loader_kwargs": self.loader_kwargs,
+                    "browser_base": self.browser_base,
+                    "scrape_do": self.scrape_do
+                }
+            ),
+            "generate_answer": GenerateAnswerNode(
+                input="user_prompt & (relevant_chunks | parsed_doc | doc)",
+                output=["answer"],
+                node_config={
+                    "llm_model": self.llm_model,
+                    "additional_info": self._additional_info,
+                    "schema": self.schema,
+                    **self._answer_options,
+                }
+            ),
+        }
 
-        if self.config.get("html_mode") is False:
-            parse_node = ParseNode(
+        if "parse" in shape:
+            nodes["parse"] = ParseNode(
                 input="doc",
                 output=["parsed_doc"],
                 node_config={
@@ -100,77 +120,25 @@ class SmartScraperGraph(AbstractGraph):
                 }
             )
 
-        if self.config.get("reasoning"):
-            reasoning_node =  ReasoningNode(
+        if "reasoning" in shape:
+            nodes["reasoning"] = ReasoningNode(
                 input="user_prompt & (relevant_chunks | parsed_doc | doc)",
                 output=["answer"],
                 node_config={
                     "llm_model": self.llm_model,
-                    "additional_info": self.config.get("additional_info"),
+                    "additional_info": self._additional_info,
                     "schema": self.schema,
                 }
             )
 
-        if self.config.get("html_mode") is False and self.config.get("reasoning") is True:
-
-            return BaseGraph(
-                nodes=[
-                    fetch_node,
-                    parse_node,
-                    reasoning_node,
-                    generate_answer_node,
-                ],
-                edges=[
-                    (fetch_node, parse_node),
-                    (parse_node, reasoning_node),
-                    (reasoning_node, generate_answer_node)
-                ],
-                entry_point=fetch_node,
-                graph_name=self.__class__.__name__
-            )
-
-        elif self.config.get("html_mode") is True and self.config.get("reasoning") is True:
-
-            return BaseGraph(
-                nodes=[
-                    fetch_node,
-                    reasoning_node,
-                    generate_answer_node,
-                ],
-                edges=[
-                    (fetch_node, reasoning_node),
-                    (reasoning_node, generate_answer_node)
-                ],
-                entry_point=fetch_node,
-                graph_name=self.__class__.__name__
-            )
-
-        elif self.config.get("html_mode") is True and self.config.get("reasoning") is False:
-            return BaseGraph(
-                nodes=[
-                    fetch_node,
-                    generate_answer_node,
-                ],
-                edges=[
-                    (fetch_node, generate_answer_node)
-                ],
-                entry_point=fetch_node,
-                graph_name=self.__class__.__name__
-            )
+        graph_nodes = [nodes[kind] for kind in shape]
 
         return BaseGraph(
-                nodes=[
-                    fetch_node,
-                    parse_node,
-                    generate_answer_node,
-                ],
-                edges=[
-                    (fetch_node, parse_node),
-                    (parse_node, generate_answer_node)
-                ],
-                entry_point=fetch_node,
-                graph_name=self.__class__.__name__
-            )
+            nodes=graph_nodes,
+            edges=list(zip(graph_nodes, graph_nodes[1:])),
+            entry_point=graph_nodes[0],
+            graph_name=self.__class__.__name__
+        )
 
     def run(self) -> str:
         """
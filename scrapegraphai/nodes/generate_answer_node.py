@@ -1,22 +1,183 @@
 """
 GenerateAnswerNode Module
 """
-from typing import List, Optional
-from langchain_core.messages import SystemMessage
-from langchain.prompts import PromptTemplate, ChatPromptTemplate, HumanMessagePromptTemplate
+import asyncio
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, List, Optional, Tuple
+from weakref import WeakKeyDictionary
+from langchain.prompts import (PromptTemplate, ChatPromptTemplate,
+                               SystemMessagePromptTemplate, HumanMessagePromptTemplate)
+from langchain_core.exceptions import OutputParserException
 from langchain_core.output_parsers import JsonOutputParser
-from langchain_core.runnables import RunnableParallel
-from langchain_openai import ChatOpenAI, AzureChatOpenAI
-from langchain_aws import ChatBedrock
-from langchain_mistralai import ChatMistralAI
-from langchain_community.chat_models import ChatOllama
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from tqdm import tqdm
 from .base_node import BaseNode
 from ..utils.output_parser import get_structured_output_parser, get_pydantic_output_parser
-from ..prompts import (
-    TEMPLATE_CHUNKS, TEMPLATE_NO_CHUNKS, TEMPLATE_MERGE,
-    TEMPLATE_CHUNKS_MD, TEMPLATE_NO_CHUNKS_MD, TEMPLATE_MERGE_MD
-)
+from ..utils.provider_batch import supports_batch_api, submit_batch
+from ..utils.provider_class import provider_class
+from ..prompts import GENERATE_ANSWER_TEMPLATES, TEMPLATE_OUTPUT_INSTRUCTIONS
+
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_BATCH_API_THRESHOLD = 16
+MERGE_STRATEGIES = ("single", "tree", "stream")
+
+_llm_loop = None
+_llm_loop_lock = threading.Lock()
+
+def _get_llm_loop() -> asyncio.AbstractEventLoop:
+    """
+    Returns the event loop running the LLM requests of every GenerateAnswerNode,
+    started on first use in a daemon thread. Requests of models without native
+    async support run on its default executor, shared by every node so that
+    concurrent graphs do not each spawn a pool. A loop living as long as the
+    process also keeps the async clients of the models bound to a single loop
+    across runs.
+    """
+    global _llm_loop
+    with _llm_loop_lock:
+        if _llm_loop is None:
+            _llm_loop = asyncio.new_event_loop()
+            _llm_loop.set_default_executor(ThreadPoolExecutor(
+                max_workers=int(os.environ.get("SGAI_LLM_WORKERS", "32")),
+                thread_name_prefix="sgai-llm",
+            ))
+            threading.Thread(target=_llm_loop.run_forever,
+                             name="sgai-llm-loop", daemon=True).start()
+    return _llm_loop
+
+def _reset_llm_loop():
+    """
+    Drops the event loop in a forked child, which inherits the loop but not the
+    threads running it and its executor, so that the child starts its own.
+    """
+    global _llm_loop, _llm_loop_lock
+    _llm_loop = None
+    _llm_loop_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_llm_loop)
+
+_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+
+def _strip_fence(message: BaseMessage):
+    """
+    Strips the markdown code fence models tend to wrap json answers in,
+    so that the prompts do not have to spend tokens asking not to.
+    """
+    if isinstance(message.content, str):
+        return _FENCE.sub("", message.content)
+    return message
+
+_STRIP_FENCE = RunnableLambda(_strip_fence)
+
+@lru_cache(maxsize=128)
+def _render_system(template: str, format_instructions: str, question: str) -> str:
+    """
+    Renders a system prompt, memoized since repeated runs of a graph
+    format the same templates with the same question over and over.
+    Without format instructions the output instructions line is left out.
+    """
+    if not format_instructions:
+        template = template.replace(TEMPLATE_OUTPUT_INSTRUCTIONS, "")
+    return template.format(format_instructions=format_instructions, question=question)
+
+_JSON_PARSER = JsonOutputParser()
+_JSON_FORMAT_INSTRUCTIONS = _JSON_PARSER.get_format_instructions()
+
+# output parsers and rendered json schemas, dropped together with their schema class
+_SCHEMA_PARSER_CACHE: "WeakKeyDictionary[type, Tuple[JsonOutputParser, str]]" = \
+    WeakKeyDictionary()
+
+def _coalesce(doc: List[str], max_chars: int) -> List[str]:
+    """
+    Joins adjacent chunks as long as the joined chunk stays within `max_chars`
+    characters, so that a document split into many small chunks takes fewer
+    requests. Larger chunks are left as they are.
+    """
+    coalesced = []
+    buffer = doc[0]
+    for chunk in doc[1:]:
+        if len(buffer) + 1 + len(chunk) > max_chars:
+            coalesced.append(buffer)
+            buffer = chunk
+        else:
+            buffer = f"{buffer}\n{chunk}"
+    coalesced.append(buffer)
+    return coalesced
+
+def _canonical(answer) -> str:
+    """
+    Returns a canonical string of an answer, equal for deep-equal json answers.
+    """
+    if isinstance(answer, (dict, list)):
+        return json.dumps(answer, sort_keys=True, default=str)
+    return str(answer)
+
+def _supports_native_json(llm_model) -> bool:
+    """
+    Tells whether the model is set to answer with json on its own, making
+    the json format instructions in the prompt redundant: an OpenAI model
+    configured with a json `response_format`. ChatOllama is always bound to
+    json format by the node.
+    """
+    if isinstance(llm_model, (provider_class("langchain_openai", "ChatOpenAI"),
+                              provider_class("langchain_openai", "AzureChatOpenAI"))):
+        response_format = llm_model.model_kwargs.get("response_format") or {}
+        return response_format.get("type") in ("json_object", "json_schema")
+    return False
+
+def _get_parser(schema: Optional[type], llm_model) -> Tuple[Any, Optional[Callable], str]:
+    """
+    Returns the model to prompt, the parser of its output and the format
+    instructions to put in the prompt for the given schema. The parser and
+    format instructions of a pydantic schema are built once per schema class,
+    free-form json needs none when the model already answers with json.
+
+    Args:
+        schema (Optional[type]): The schema of the answer, None for free-form json.
+        llm_model: The language model of the node.
+
+    Returns:
+        Tuple[Any, Optional[Callable], str]: The model, the output parser (None when
+        the model output is returned as is) and the format instructions.
+    """
+    native_json = _supports_native_json(llm_model)
+    if isinstance(llm_model, provider_class("langchain_community.chat_models.ollama",
+                                            "ChatOllama")):
+        # json format is bound to the calls of the node rather than set on the
+        # model, whose instance is shared with nodes wanting free-form answers
+        llm_model = llm_model.bind(format="json")
+        native_json = True
+
+    if schema is not None and isinstance(
+            llm_model, (provider_class("langchain_openai", "ChatOpenAI"),
+                        provider_class("langchain_mistralai", "ChatMistralAI"))):
+        return (llm_model.with_structured_output(schema=schema),
+                get_structured_output_parser(schema), "NA")
+
+    if isinstance(llm_model, provider_class("langchain_aws", "ChatBedrock")):
+        return llm_model, None, ""
+
+    if schema is None:
+        if native_json:
+            return llm_model, _JSON_PARSER, ""
+        return llm_model, _JSON_PARSER, _JSON_FORMAT_INSTRUCTIONS
+
+    cached = _SCHEMA_PARSER_CACHE.get(schema)
+    if cached is None:
+        # a parser bound to the schema only reads it to render the format
+        # instructions and otherwise parses like the shared json parser,
+        # caching the latter keeps the entry from holding its schema alive
+        format_instructions = get_pydantic_output_parser(schema).get_format_instructions()
+        cached = _SCHEMA_PARSER_CACHE[schema] = (_JSON_PARSER, format_instructions)
+    output_parser, format_instructions = cached
+    return llm_model, output_parser, format_instructions
 
 class GenerateAnswerNode(BaseNode):
     """
@@ -38,6 +199,11 @@ class GenerateAnswerNode(BaseNode):
         is_md_scraper (bool): Whether the node is scraping markdown data.
         additional_info (Optional[str]): Any additional information to be
         included in the prompt templates.
+        merge_strategy (str): How the answers of the chunks are merged,
+        one of "single", "tree" or "stream".
+        max_chunk_chars (int): The number of characters adjacent chunks are
+        joined up to, 0 when chunks are not joined. Joining is opt-in since
+        characters do not tell how many tokens a chunk takes.
     """
     def __init__(
         self,
@@ -49,14 +215,69 @@ class GenerateAnswerNode(BaseNode):
         super().__init__(node_name, "node", input, output, 2, node_config)
         self.llm_model = node_config["llm_model"]
 
-        if isinstance(node_config["llm_model"], ChatOllama):
-            self.llm_model.format = "json"
-
         self.verbose = node_config.get("verbose", False)
         self.force = node_config.get("force", False)
         self.script_creator = node_config.get("script_creator", False)
         self.is_md_scraper = node_config.get("is_md_scraper", False)
         self.additional_info = node_config.get("additional_info")
+        self.merge_strategy = node_config.get("merge_strategy") or "single"
+        self.max_chunk_chars = node_config.get("max_chunk_chars") or 0
+
+        if self.merge_strategy not in MERGE_STRATEGIES:
+            raise ValueError(f"""Merge strategy {self.merge_strategy} is not supported,
+                             use one of {", ".join(MERGE_STRATEGIES)}.""")
+
+        # markdown content comes from markdown scrapers, or from the html
+        # converted for OpenAI models or when forced, except for script creators
+        use_md = self.is_md_scraper or (
+            not self.script_creator
+            and (isinstance(self.llm_model,
+                            (provider_class("langchain_openai", "ChatOpenAI"),
+                             provider_class("langchain_openai", "AzureChatOpenAI")))
+                 or self.force)
+        )
+        self._templates = {
+            mode: GENERATE_ANSWER_TEMPLATES[(use_md, mode)]
+            for mode in ("no_chunks", "chunks", "marshal", "merge")
+        }
+
+        if self.additional_info is not None:
+            self._templates = {mode: self.additional_info + template
+                               for mode, template in self._templates.items()}
+
+        # the system prompt only depends on the question and the output format,
+        # it is rendered once per run and given to these prebuilt templates
+        human_templates = {
+            "no_chunks": "The following is the website content:\n{web_content}",
+            "marshal": "{context}",
+            "merge": "Here are all the chunks:\n{context}",
+        }
+        self._prompts = {
+            mode: ChatPromptTemplate.from_messages(
+                [
+                    SystemMessagePromptTemplate.from_template("{system_prompt}"),
+                    HumanMessagePromptTemplate.from_template(human_template),
+                ]
+            )
+            for mode, human_template in human_templates.items()
+        }
+
+    def _get_prompt(self, mode: str, format_instructions: str,
+                    user_prompt: str) -> ChatPromptTemplate:
+        """
+        Returns the prebuilt chat template of the given mode
+        with its system prompt filled in.
+
+        Args:
+            mode (str): One of "no_chunks", "marshal" or "merge".
+            format_instructions (str): The output format instructions.
+            user_prompt (str): The question asked by the user.
+
+        Returns:
+            ChatPromptTemplate: The chat template, only missing the content variables.
+        """
+        system_prompt = _render_system(self._templates[mode], format_instructions, user_prompt)
+        return self._prompts[mode].partial(system_prompt=system_prompt)
 
     def execute(self, state: dict) -> dict:
         """
@@ -71,98 +292,193 @@ class GenerateAnswerNode(BaseNode):
         """
         self.logger.info(f"--- Executing {self.node_name} Node ---")
 
+        future = asyncio.run_coroutine_threadsafe(self._async_execute(state), _get_llm_loop())
+        return future.result()
+
+    async def _async_execute(self, state: dict) -> dict:
+        """
+        Generates the answer asynchronously, sending the chunk prompts
+        concurrently with at most `max_concurrency` requests in flight.
+
+        Args:
+            state (dict): The current state of the graph. The input keys will be used
+                          to fetch the correct data from the state.
+
+        Returns:
+            dict: The updated state with the output key containing the generated answer.
+        """
+
         input_keys = self.get_input_keys(state)
         input_data = [state[key] for key in input_keys]
         user_prompt = input_data[0]
         doc = input_data[1]
 
-        if self.node_config.get("schema", None) is not None:
-            if isinstance(self.llm_model, (ChatOpenAI, ChatMistralAI)):
-                self.llm_model = self.llm_model.with_structured_output(
-                    schema=self.node_config["schema"]
-                )
-                output_parser = get_structured_output_parser(self.node_config["schema"])
-                format_instructions = "NA"
-            else:
-                if not isinstance(self.llm_model, ChatBedrock):
-                    output_parser = get_pydantic_output_parser(self.node_config["schema"])
-                    format_instructions = output_parser.get_format_instructions()
-                else:
-                    output_parser = None
-                    format_instructions = ""
-        else:
-            if not isinstance(self.llm_model, ChatBedrock):
-                output_parser = JsonOutputParser()
-                format_instructions = output_parser.get_format_instructions()
-            else:
-                output_parser = None
-                format_instructions = ""
-
-        if isinstance(self.llm_model, (ChatOpenAI, AzureChatOpenAI)) \
-            and not self.script_creator \
-            or self.force \
-            and not self.script_creator or self.is_md_scraper:
-            template_no_chunks_prompt = TEMPLATE_NO_CHUNKS_MD
-            template_chunks_prompt = TEMPLATE_CHUNKS_MD
-            template_merge_prompt = TEMPLATE_MERGE_MD
+        llm_model, output_parser, format_instructions = _get_parser(
+            self.node_config.get("schema"), self.llm_model
+        )
+
+        if isinstance(output_parser, JsonOutputParser):
+            parser = _STRIP_FENCE | output_parser
         else:
-            template_no_chunks_prompt = TEMPLATE_NO_CHUNKS
-            template_chunks_prompt = TEMPLATE_CHUNKS
-            template_merge_prompt = TEMPLATE_MERGE
+            # structured output is already parsed, models without
+            # a parser hand back their message as is
+            parser = output_parser or RunnablePassthrough()
 
-        if self.additional_info is not None:
-            template_no_chunks_prompt = self.additional_info + template_no_chunks_prompt
-            template_chunks_prompt = self.additional_info + template_chunks_prompt
-            template_merge_prompt = self.additional_info + template_merge_prompt
+        if self.max_chunk_chars and len(doc) > 1 \
+            and all(isinstance(chunk, str) for chunk in doc):
+            doc = _coalesce(doc, self.max_chunk_chars)
 
         if len(doc) == 1:
-            system_msg = SystemMessage(content=template_no_chunks_prompt.format(format_instructions=format_instructions, question=user_prompt))
-            chat_template = ChatPromptTemplate.from_messages(
-                [
-                    system_msg,
-                    HumanMessagePromptTemplate.from_template("The following is the website content:\n{web_content}"),
-                ]
-            )
-
-            chain = chat_template | self.llm_model
-            if output_parser:
-                chain = chain | output_parser
-            answer =  chain.invoke({"web_content" : doc[0]})
+            chain = self._get_prompt("no_chunks", format_instructions, user_prompt) \
+                | llm_model | parser
+            answer = await chain.ainvoke({"web_content": doc[0]})
 
             state.update({self.output[0]: answer})
             return state
 
-        chains_dict = {}
-        system_msg = SystemMessage(content=template_chunks_prompt.format(format_instructions=format_instructions, question=user_prompt))
-        batch_input = []
-        for i, chunk in enumerate(tqdm(doc, desc="Processing chunks", disable=not self.verbose)):
-            chat_template = ChatPromptTemplate.from_messages(
-                [
-                    system_msg,
-                    HumanMessagePromptTemplate.from_template("Content of {chunk_id}:\n{context}"),
-                ]
-            )
-            batch_input.append({"chunk_id":i + 1, "context":chunk})
-            chain_name = f"chunk{i+1}"
-            chains_dict[chain_name] = chat_template | self.llm_model
-            if output_parser:
-                chains_dict[chain_name] = chains_dict[chain_name] | output_parser
-        
-        async_runner = RunnableParallel(**chains_dict)
-        batch_results =  async_runner.batch(inputs=batch_input)
-
-        system_msg = SystemMessage(content=template_merge_prompt.format(format_instructions=format_instructions, question=user_prompt))
-        merge_prompt = ChatPromptTemplate.from_messages(
-                [
-                    system_msg,
-                    HumanMessagePromptTemplate.from_template("Here are all the chunks:\n{context}"),
-                ]
-            )
+        # the chunk messages are built directly, with the system prompt rendered
+        # once, rather than through the template engine for every chunk
+        system_msg = SystemMessage(
+            content=_render_system(self._templates["chunks"], format_instructions, user_prompt)
+        )
+        # a disabled tqdm still wraps the iteration, skip it altogether when quiet
+        chunks = tqdm(doc, desc="Processing chunks") if self.verbose else doc
+        batch_input = [
+            [system_msg, HumanMessage(content=f"Content of {i + 1}:\n{chunk}")]
+            for i, chunk in enumerate(chunks)
+        ]
+        chain = llm_model | parser
+        max_concurrency = self.node_config.get("max_concurrency") or DEFAULT_MAX_CONCURRENCY
+
+        batch_results = [None] * len(doc)
+        pending = range(len(doc))
+
+        marshal_size = self.node_config.get("marshal_size") or 1
+        if marshal_size > 1 and isinstance(output_parser, JsonOutputParser):
+            marshal_prompt = self._get_prompt("marshal", format_instructions, user_prompt)
+            answers = await self._marshal_chunks(llm_model, doc, marshal_prompt, marshal_size,
+                                                 max_concurrency)
+            for i, answer in answers.items():
+                batch_results[i] = answer
+            pending = [i for i in pending if i not in answers]
+
+        batch_api_threshold = self.node_config.get("batch_api_threshold") \
+            or DEFAULT_BATCH_API_THRESHOLD
+        if self.node_config.get("use_batch_api") and len(pending) >= batch_api_threshold \
+            and isinstance(output_parser, JsonOutputParser) and supports_batch_api(llm_model):
+            # the job is polled until it ends, up to a day, on a thread of its own
+            # rather than holding one of the workers shared by the LLM requests
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="sgai-batch") as executor:
+                texts = await asyncio.get_running_loop().run_in_executor(
+                    executor, submit_batch, llm_model, [batch_input[i] for i in pending]
+                )
+            # a failed request or a bad answer does not throw away the rest
+            # of the job, its chunk is sent again on its own below
+            failed = []
+            for i, text in zip(pending, texts):
+                try:
+                    batch_results[i] = output_parser.parse(_FENCE.sub("", text))
+                except (TypeError, OutputParserException):
+                    failed.append(i)
+            if failed:
+                self.logger.warning(f"Could not use the batch answers of {len(failed)} chunks, "
+                                    f"sending them one at a time")
+            pending = failed
+
+        # dispatch the longest chunks first: once max_concurrency requests are in
+        # flight the short chunks fill the freed slots, instead of a long chunk
+        # being sent last and stalling the merge on its own, documents are
+        # measured by their content
+        order = sorted(pending, key=lambda i: len(getattr(doc[i], "page_content", doc[i])),
+                       reverse=True)
+        results = await chain.abatch([batch_input[i] for i in order],
+                                     config={"max_concurrency": max_concurrency})
+        for i, result in zip(order, results):
+            batch_results[i] = result
+
+        # nothing to merge when every chunk got the same answer,
+        # which is common on pages repeating their navigation
+        if len({_canonical(result) for result in batch_results}) == 1:
+            state.update({self.output[0]: batch_results[0]})
+            return state
 
-        merge_chain = merge_prompt | self.llm_model
-        if output_parser:
-            merge_chain = merge_chain | output_parser
-        answer =  merge_chain.invoke({"context": batch_results})
+        merge_chain = self._get_prompt("merge", format_instructions, user_prompt) \
+            | llm_model | parser
+        answer = await self._merge_answers(merge_chain, batch_results, max_concurrency)
 
         state.update({self.output[0]: answer})
         return state
+
+    async def _merge_answers(self, merge_chain, batch_results: list, max_concurrency: int):
+        """
+        Merges the answers of the chunks into the final answer following the
+        merge strategy of the node: "single" merges all the answers at once,
+        "tree" merges adjacent pairs round after round (log2(N) rounds of small
+        prompts) and "stream" folds the answers one at a time into a running answer.
+
+        Args:
+            merge_chain: The chain merging a list of answers into a single one.
+            batch_results (list): The answers of the chunks, in document order.
+            max_concurrency (int): The maximum number of requests in flight.
+
+        Returns:
+            The merged answer.
+        """
+        if self.merge_strategy == "single":
+            return await merge_chain.ainvoke({"context": batch_results})
+
+        if self.merge_strategy == "tree":
+            answers = batch_results
+            while len(answers) > 1:
+                pairs = [answers[i:i + 2] for i in range(0, len(answers) - 1, 2)]
+                merged = await merge_chain.abatch([{"context": pair} for pair in pairs],
+                                                  config={"max_concurrency": max_concurrency})
+                # an odd answer out goes on to the next round as is
+                answers = merged + answers[2 * len(pairs):]
+            return answers[0]
+
+        answer = batch_results[0]
+        for result in batch_results[1:]:
+            answer = await merge_chain.ainvoke({"context": [answer, result]})
+        return answer
+
+    async def _marshal_chunks(self, llm_model, doc: List[str], marshal_prompt: ChatPromptTemplate,
+                              marshal_size: int, max_concurrency: int) -> dict:
+        """
+        Answers groups of `marshal_size` adjacent chunks with a single request each,
+        asking the model for a json object whose "answers" list holds one answer per chunk.
+
+        Args:
+            llm_model: The model to prompt, as returned by `_get_parser`.
+            doc (List[str]): The chunks of the document.
+            marshal_prompt (ChatPromptTemplate): The chat template of the marshaled requests.
+            marshal_size (int): The number of chunks sent in each request.
+            max_concurrency (int): The maximum number of requests in flight.
+
+        Returns:
+            dict: The answers keyed by chunk index. The chunks of a group whose reply
+            is not a list of one json object per chunk are left out.
+        """
+        chain = marshal_prompt | llm_model | _STRIP_FENCE | _JSON_PARSER
+
+        groups = [range(start, min(start + marshal_size, len(doc)))
+                  for start in range(0, len(doc), marshal_size)]
+        batch_input = [
+            {"context": "\n---\n".join(f"Chunk {i + 1}:\n{doc[i]}" for i in group)}
+            for group in groups
+        ]
+        results = await chain.abatch(batch_input, config={"max_concurrency": max_concurrency},
+                                     return_exceptions=True)
+
+        answers = {}
+        for group, result in zip(groups, results):
+            # the list is asked for under an explicit key, since answers are often
+            # objects with a single list themselves, and each item must be an answer
+            chunk_answers = result.get("answers") if isinstance(result, dict) else None
+            if isinstance(chunk_answers, list) and len(chunk_answers) == len(group) \
+                    and all(isinstance(answer, dict) for answer in chunk_answers):
+                answers.update(zip(group, chunk_answers))
+            else:
+                self.logger.warning(f"Could not split the answer for chunks {group.start + 1}"
+                                    f"-{group.stop}, sending them one at a time")
+        return answers
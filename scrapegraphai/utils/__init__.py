@@ -28,3 +28,5 @@ from .code_error_correction import (syntax_focused_code_generation,
                                     validation_focused_code_generation,
                                     semantic_focused_code_generation)
 from .save_code_to_file import save_code_to_file
+from .provider_batch import supports_batch_api, submit_batch
+from .provider_class import provider_class
@@ -0,0 +1,152 @@
+"""
+Module for sending many prompts at once through the batch API of the provider
+"""
+import json
+import time
+from typing import List, Optional
+from langchain_core.messages import BaseMessage
+from .provider_class import provider_class
+
+OPENAI_API_BASE = "https://api.openai.com"
+TERMINAL_BATCH_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+def _is_anthropic(llm_model) -> bool:
+    # older anthropic SDKs only expose the batch API under client.beta
+    return isinstance(llm_model, provider_class("langchain_anthropic", "ChatAnthropic")) and \
+        hasattr(llm_model._client.messages, "batches")
+
+def _is_openai(llm_model) -> bool:
+    # OpenAI-compatible servers reached through ChatOpenAI have no batch API
+    return isinstance(llm_model, provider_class("langchain_openai", "ChatOpenAI")) and \
+        (llm_model.openai_api_base is None or
+         llm_model.openai_api_base.startswith(OPENAI_API_BASE))
+
+def supports_batch_api(llm_model) -> bool:
+    """
+    Tells whether the prompts of the model can be sent through a provider batch API.
+
+    Args:
+        llm_model: The language model.
+
+    Returns:
+        bool: True for OpenAI chat models and for Anthropic chat models
+        whose SDK exposes the message batches API.
+    """
+    return _is_openai(llm_model) or _is_anthropic(llm_model)
+
+def submit_batch(llm_model, messages_list: List[List[BaseMessage]],
+                 poll_interval: float = 10) -> List[Optional[str]]:
+    """
+    Sends the prompts as a single batch job to the batch API of the provider,
+    waits for the job to end and collects the answers.
+
+    Batch jobs are priced at about half of the unary requests, but may take
+    up to 24 hours to complete.
+
+    Args:
+        llm_model: The language model, an OpenAI or Anthropic chat model.
+        messages_list (List[List[BaseMessage]]): The messages of each prompt.
+        poll_interval (float, optional): The number of seconds between two checks
+        of the job status. Default is 10 seconds.
+
+    Returns:
+        List[Optional[str]]: The text answers, in the order of the prompts, None for
+        the requests that failed, expired or were cancelled and for the answers
+        holding no text (refusals, tool calls).
+
+    Raises:
+        ValueError: If the model has no supported batch API.
+        RuntimeError: If the job does not answer any of the prompts.
+
+    Example:
+        >>> submit_batch(llm_model, [[HumanMessage("Return {}")], [HumanMessage("Return []")]])
+        ['{}', '[]']
+    """
+    if _is_openai(llm_model):
+        answers = _submit_openai_batch(llm_model, messages_list, poll_interval)
+    elif _is_anthropic(llm_model):
+        answers = _submit_anthropic_batch(llm_model, messages_list, poll_interval)
+    else:
+        raise ValueError(f"The batch API is not supported for {type(llm_model).__name__}")
+
+    # the answers of a finished job are paid for, the prompts it did not
+    # answer are left to the caller instead of throwing the rest away
+    return [answers.get(i) for i in range(len(messages_list))]
+
+def _submit_openai_batch(llm_model, messages_list: List[List[BaseMessage]],
+                         poll_interval: float) -> dict:
+    client = llm_model.root_client
+
+    requests = []
+    for i, messages in enumerate(messages_list):
+        body = llm_model._get_request_payload(messages)
+        body.pop("stream", None)
+        requests.append(json.dumps({"custom_id": str(i), "method": "POST",
+                                    "url": "/v1/chat/completions", "body": body}))
+    input_file = client.files.create(file=("batch.jsonl", "\n".join(requests).encode()),
+                                     purpose="batch")
+
+    batch = client.batches.create(input_file_id=input_file.id,
+                                  endpoint="/v1/chat/completions",
+                                  completion_window="24h")
+    while batch.status not in TERMINAL_BATCH_STATUSES:
+        time.sleep(poll_interval)
+        batch = client.batches.retrieve(batch.id)
+
+    # the failed requests are listed in a separate error file, without any
+    # output file when every request failed, an expired or cancelled job
+    # still hands over the requests it got through
+    if not (batch.output_file_id or batch.error_file_id):
+        raise RuntimeError(f"OpenAI batch {batch.id} ended with status {batch.status}")
+
+    records = []
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id:
+            records.extend(json.loads(line)
+                           for line in client.files.content(file_id).text.splitlines())
+
+    answers = {}
+    errors = []
+    for record in records:
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            errors.append(f"prompt {record['custom_id']}: "
+                          f"{record.get('error') or response.get('body')}")
+        else:
+            content = response["body"]["choices"][0]["message"].get("content")
+            answers[int(record["custom_id"])] = content if isinstance(content, str) else None
+
+    if errors and not answers:
+        raise RuntimeError(f"OpenAI batch {batch.id} failed on {len(errors)} prompts, "
+                           f"{'; '.join(errors[:5])}")
+    return answers
+
+def _submit_anthropic_batch(llm_model, messages_list: List[List[BaseMessage]],
+                            poll_interval: float) -> dict:
+    client = llm_model._client
+
+    requests = []
+    for i, messages in enumerate(messages_list):
+        params = llm_model._get_request_payload(messages)
+        params.pop("stream", None)
+        requests.append({"custom_id": str(i), "params": params})
+
+    batch = client.messages.batches.create(requests=requests)
+    while batch.processing_status != "ended":
+        time.sleep(poll_interval)
+        batch = client.messages.batches.retrieve(batch.id)
+
+    answers = {}
+    errors = []
+    for entry in client.messages.batches.results(batch.id):
+        if entry.result.type != "succeeded":
+            # errored, expired or canceled
+            errors.append(f"prompt {entry.custom_id}: {entry.result.type}")
+            continue
+        texts = [block.text for block in entry.result.message.content if block.type == "text"]
+        answers[int(entry.custom_id)] = "".join(texts) if texts else None
+
+    if errors and not answers:
+        raise RuntimeError(f"Anthropic batch {batch.id} failed on {len(errors)} prompts, "
+                           f"{'; '.join(errors[:5])}")
+    return answers
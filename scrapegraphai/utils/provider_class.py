@@ -0,0 +1,24 @@
+"""
+Module for looking up the chat model classes of the provider packages
+"""
+import sys
+
+def provider_class(module: str, name: str):
+    """
+    Returns the chat model class of a provider package without importing it,
+    for isinstance checks that should not load every provider SDK. A package
+    that was never imported cannot have built the model, so an empty tuple,
+    matching no instance, is returned instead.
+
+    Args:
+        module (str): The module defining the class.
+        name (str): The name of the class.
+
+    Returns:
+        The class, or an empty tuple when its module is not loaded.
+
+    Example:
+        >>> isinstance(llm_model, provider_class("langchain_openai", "ChatOpenAI"))
+        False
+    """
+    return getattr(sys.modules.get(module), name, ())
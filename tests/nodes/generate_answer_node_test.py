@@ -0,0 +1,429 @@
+"""
+GenerateAnswerNode test module
+"""
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+from typing import Any, Callable, List, Optional
+from unittest.mock import patch
+import pytest
+from pydantic import BaseModel
+from langchain_core.documents import Document
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from scrapegraphai.nodes import GenerateAnswerNode
+from scrapegraphai.utils.output_parser import get_pydantic_output_parser
+
+
+def _echo(messages: List[BaseMessage]) -> str:
+    return json.dumps({"echo": messages[-1].content})
+
+
+def _echo_marshaled(messages: List[BaseMessage]) -> str:
+    # one json answer per chunk
+    chunks = messages[-1].content.split("\n---\n")
+    return json.dumps({"answers": [{"echo": chunk} for chunk in chunks]})
+
+
+def _merge_marshaled(messages: List[BaseMessage]) -> str:
+    # a single merged answer for the marshaled prompts
+    if "\n---\n" not in messages[-1].content:
+        return _echo(messages)
+    return json.dumps({"title": ["Home", "Home"]})
+
+
+def _constant():
+    # the same answer to every prompt, with the key order varying
+    # to check answers are compared as json
+    replies = itertools.count()
+    return lambda messages: json.dumps({"title": "Home", "links": ["a", "b"]},
+                                       sort_keys=next(replies) % 2 == 0)
+
+
+class EchoChatModel(BaseChatModel):
+    """
+    Fake chat model answering with a json object that echoes the last message,
+    or with the reply it is given, recording every prompt it receives.
+    """
+    calls: List[List[BaseMessage]] = []
+    reply: Callable[[List[BaseMessage]], str] = _echo
+
+    @property
+    def _llm_type(self) -> str:
+        return "echo"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[Any] = None, **kwargs: Any) -> ChatResult:
+        self.calls.append(messages)
+        content = self.reply(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+
+def make_node(llm_model, **options) -> GenerateAnswerNode:
+    """
+    Builds a GenerateAnswerNode answering from `doc` with the given node options.
+    """
+    return GenerateAnswerNode(
+        input="user_prompt & doc",
+        output=["answer"],
+        node_config={"llm_model": llm_model, **options}
+    )
+
+
+@pytest.fixture
+def llm_model():
+    return EchoChatModel(calls=[])
+
+
+@pytest.fixture
+def generate_answer_node(llm_model):
+    return GenerateAnswerNode(
+        input="user_prompt & (relevant_chunks | parsed_doc | doc)",
+        output=["answer"],
+        node_config={"llm_model": llm_model}
+    )
+
+
+def test_generate_answer_single_chunk(generate_answer_node, llm_model):
+    state = {"user_prompt": "What is the title?", "doc": ["<h1>Title</h1>"]}
+
+    result = generate_answer_node.execute(state)
+
+    assert len(llm_model.calls) == 1
+    assert result["answer"] == {
+        "echo": "The following is the website content:\n<h1>Title</h1>"
+    }
+
+
+def test_generate_answer_multiple_chunks(generate_answer_node, llm_model):
+    doc = ["first chunk", "second chunk", "third chunk"]
+    state = {"user_prompt": "What is the title?", "parsed_doc": doc}
+
+    result = generate_answer_node.execute(state)
+
+    # one call per chunk plus the merge call
+    assert len(llm_model.calls) == len(doc) + 1
+    assert result["answer"]["echo"].startswith("Here are all the chunks:")
+    for chunk in doc:
+        assert chunk in result["answer"]["echo"]
+
+
+def test_generate_answer_skips_merge_of_equal_answers():
+    llm_model = EchoChatModel(calls=[], reply=_constant())
+    node = make_node(llm_model)
+    doc = ["menu", "menu", "menu"]
+    state = {"user_prompt": "What is the title?", "doc": doc}
+
+    result = node.execute(state)
+
+    assert len(llm_model.calls) == len(doc)
+    assert result["answer"] == {"title": "Home", "links": ["a", "b"]}
+
+
+def test_generate_answer_reuses_prompts(generate_answer_node, llm_model):
+    prompts = dict(generate_answer_node._prompts)
+
+    for question in ["Return {\"title\": ...}", "What is the title?"]:
+        state = {"user_prompt": question, "doc": ["first chunk", "second chunk"]}
+        generate_answer_node.execute(state)
+        assert f"QUESTION: {question}" in llm_model.calls[-1][0].content
+
+    assert generate_answer_node._prompts == prompts
+
+
+def test_generate_answer_with_schema_runs_twice(llm_model):
+    class Answer(BaseModel):
+        echo: str
+
+    node = make_node(llm_model, schema=Answer)
+    state = {"user_prompt": "What is the title?", "doc": ["<h1>Title</h1>"]}
+
+    first = node.execute(state)["answer"]
+    second = node.execute(state)["answer"]
+
+    assert first == second
+    assert node.llm_model is llm_model
+    assert '"echo"' in llm_model.calls[0][0].content
+
+
+def test_generate_answer_caches_schema_parser(llm_model):
+    from scrapegraphai.nodes.generate_answer_node import _get_parser
+
+    class Answer(BaseModel):
+        echo: str
+
+    with patch("scrapegraphai.nodes.generate_answer_node.get_pydantic_output_parser",
+               wraps=get_pydantic_output_parser) as build_parser:
+        first = _get_parser(Answer, llm_model)
+        second = _get_parser(Answer, llm_model)
+
+    assert build_parser.call_count == 1
+    assert first[1] is second[1]
+    assert '"echo"' in first[2]
+
+
+def test_generate_answer_inside_running_loop(generate_answer_node, llm_model):
+    state = {"user_prompt": "What is the title?", "doc": ["first chunk", "second chunk"]}
+
+    async def run():
+        return generate_answer_node.execute(state)
+
+    result = asyncio.run(run())
+
+    assert len(llm_model.calls) == 3
+    assert "answer" in result
+
+
+def _execute_in_child(node, state):
+    node.execute(state)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_generate_answer_after_fork(generate_answer_node):
+    state = {"user_prompt": "What is the title?", "doc": ["first chunk", "second chunk"]}
+    generate_answer_node.execute(state)
+
+    child = multiprocessing.get_context("fork").Process(
+        target=_execute_in_child, args=(generate_answer_node, state)
+    )
+    child.start()
+    child.join(timeout=30)
+    if child.is_alive():
+        child.kill()
+
+    assert child.exitcode == 0
+
+
+def test_generate_answer_longest_chunks_first(llm_model):
+    node = make_node(llm_model, max_concurrency=1)
+    doc = ["short", "the longest chunk of all", "medium chunk"]
+    state = {"user_prompt": "What is the title?", "doc": doc}
+
+    node.execute(state)
+
+    sent = [call[-1].content for call in llm_model.calls[:-1]]
+    assert sent == [
+        "Content of 2:\nthe longest chunk of all",
+        "Content of 3:\nmedium chunk",
+        "Content of 1:\nshort",
+    ]
+    merged = llm_model.calls[-1][-1].content
+    assert merged.index("short") < merged.index("the longest") < merged.index("medium")
+
+
+def test_generate_answer_document_chunks(llm_model):
+    node = make_node(llm_model, max_concurrency=1)
+    doc = [Document(page_content="page 1"), Document(page_content="the longer page 2")]
+    state = {"user_prompt": "What is the title?", "doc": doc}
+
+    result = node.execute(state)
+
+    assert len(llm_model.calls) == len(doc) + 1
+    assert "page 1" in result["answer"]["echo"]
+    assert "the longer page 2" in llm_model.calls[0][-1].content
+
+
+def test_generate_answer_marshaled_chunks():
+    llm_model = EchoChatModel(calls=[], reply=_echo_marshaled)
+    node = make_node(llm_model, marshal_size=2)
+    state = {"user_prompt": "What is the title?", "doc": [f"chunk {i}" for i in range(5)]}
+
+    node.execute(state)
+
+    # three marshaled requests plus the merge call
+    assert len(llm_model.calls) == 4
+    merged = llm_model.calls[-1][-1].content
+    for i in range(5):
+        assert f"Chunk {i + 1}:\\nchunk {i}" in merged
+
+
+def test_generate_answer_marshaled_chunks_fallback(llm_model):
+    node = make_node(llm_model, marshal_size=2)
+    state = {"user_prompt": "What is the title?", "doc": [f"chunk {i}" for i in range(5)]}
+
+    node.execute(state)
+
+    # every marshaled reply is malformed, so each chunk is sent on its own
+    assert len(llm_model.calls) == 3 + 5 + 1
+
+
+def test_generate_answer_marshaled_single_answer_fallback():
+    llm_model = EchoChatModel(calls=[], reply=_merge_marshaled)
+    node = make_node(llm_model, marshal_size=2)
+    state = {"user_prompt": "What is the title?", "doc": ["chunk 0", "chunk 1"]}
+
+    result = node.execute(state)
+
+    # the one-key reply is not taken as the answers of the chunks
+    assert len(llm_model.calls) == 1 + 2 + 1
+    assert isinstance(result["answer"], dict)
+
+
+@pytest.mark.parametrize("merge_strategy, merge_calls", [
+    ("single", 1),
+    ("tree", 4),
+    ("stream", 4),
+])
+def test_generate_answer_merge_strategy(llm_model, merge_strategy, merge_calls):
+    node = make_node(llm_model, merge_strategy=merge_strategy)
+    doc = [f"chunk {i}" for i in range(5)]
+    state = {"user_prompt": "What is the title?", "doc": doc}
+
+    result = node.execute(state)
+
+    assert len(llm_model.calls) == len(doc) + merge_calls
+    for chunk in doc:
+        assert chunk in json.dumps(result["answer"])
+
+
+def test_generate_answer_unknown_merge_strategy(llm_model):
+    with pytest.raises(ValueError):
+        make_node(llm_model, merge_strategy="random")
+
+
+def test_generate_answer_coalesces_small_chunks(llm_model):
+    node = make_node(llm_model, max_chunk_chars=30)
+    doc = ["a" * 10, "b" * 10, "c" * 10, "d" * 40, "e" * 5]
+    state = {"user_prompt": "What is the title?", "doc": doc}
+
+    node.execute(state)
+
+    sent = sorted(call[-1].content for call in llm_model.calls[:-1])
+    assert sent == [
+        "Content of 1:\n" + "\n".join(["a" * 10, "b" * 10]),
+        "Content of 2:\n" + "\n".join(["c" * 10]),
+        "Content of 3:\n" + "d" * 40,
+        "Content of 4:\n" + "e" * 5,
+    ]
+
+
+def test_generate_answer_coalesces_into_single_chunk(llm_model):
+    node = make_node(llm_model, max_chunk_chars=100)
+    state = {"user_prompt": "What is the title?", "doc": ["first chunk", "second chunk"]}
+
+    result = node.execute(state)
+
+    assert len(llm_model.calls) == 1
+    assert result["answer"] == {
+        "echo": "The following is the website content:\nfirst chunk\nsecond chunk"
+    }
+
+
+def test_generate_answer_coalescing_off_by_default(llm_model):
+    node = make_node(llm_model)
+    state = {"user_prompt": "What is the title?", "doc": ["first chunk", "second chunk"]}
+
+    node.execute(state)
+
+    assert len(llm_model.calls) == 3
+
+
+def test_generate_answer_marshaled_chunks_ollama_json_format():
+    from langchain_community.chat_models import ChatOllama
+
+    class MarshalOllama(ChatOllama):
+        calls: List[Any] = []
+
+        def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                      run_manager: Optional[Any] = None, **kwargs: Any) -> ChatResult:
+            self.calls.append(kwargs)
+            chunks = messages[-1].content.split("\n---\n")
+            content = json.dumps({"answers": [{"echo": chunk} for chunk in chunks]})
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+        async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                             run_manager: Optional[Any] = None, **kwargs: Any) -> ChatResult:
+            return self._generate(messages, stop, **kwargs)
+
+    llm_model = MarshalOllama(model="llama3", calls=[])
+    node = make_node(llm_model, marshal_size=2)
+    state = {"user_prompt": "What is the title?", "doc": [f"chunk {i}" for i in range(4)]}
+
+    node.execute(state)
+
+    # two marshaled requests plus the merge call, all in json format
+    assert len(llm_model.calls) == 3
+    assert all(call.get("format") == "json" for call in llm_model.calls)
+
+
+def test_generate_answer_binds_ollama_json_format():
+    from langchain_community.chat_models import ChatOllama
+    from scrapegraphai.nodes.generate_answer_node import _get_parser
+
+    llm_model = ChatOllama(model="llama3")
+    node = make_node(llm_model)
+
+    bound_model, _, format_instructions = _get_parser(None, node.llm_model)
+
+    assert llm_model.format is None
+    assert bound_model.kwargs == {"format": "json"}
+    assert format_instructions == ""
+
+
+@pytest.mark.parametrize("node_options, use_md", [
+    ({}, False),
+    ({"force": True}, True),
+    ({"force": True, "script_creator": True}, False),
+    ({"script_creator": True, "is_md_scraper": True}, True),
+])
+def test_generate_answer_markdown_templates(llm_model, node_options, use_md):
+    node = make_node(llm_model, **node_options)
+
+    assert ("markdown" in node._templates["no_chunks"]) is use_md
+
+
+@pytest.mark.parametrize("response_format, native_json", [
+    ({"type": "json_object"}, True),
+    ({"type": "text"}, False),
+    (None, False),
+])
+def test_generate_answer_openai_response_format(response_format, native_json):
+    from langchain_openai import ChatOpenAI
+    from scrapegraphai.nodes.generate_answer_node import _get_parser
+
+    model_kwargs = {"response_format": response_format} if response_format else {}
+    llm_model = ChatOpenAI(api_key="sk-test", model="gpt-4o-mini", model_kwargs=model_kwargs)
+
+    _, _, format_instructions = _get_parser(None, llm_model)
+
+    assert (format_instructions == "") is native_json
+
+
+def test_generate_answer_batch_api_thread(llm_model):
+    node = make_node(llm_model, use_batch_api=True, batch_api_threshold=2)
+    threads = []
+
+    def submit_batch(model, messages_list):
+        threads.append(threading.current_thread().name)
+        return [json.dumps({"echo": messages[-1].content}) for messages in messages_list]
+
+    with patch("scrapegraphai.nodes.generate_answer_node.supports_batch_api", return_value=True), \
+            patch("scrapegraphai.nodes.generate_answer_node.submit_batch", submit_batch):
+        result = node.execute({"user_prompt": "What is the title?", "doc": ["first", "second"]})
+
+    # the job is polled away from the workers of the LLM requests
+    assert threads[0].startswith("sgai-batch")
+    # only the merge call goes through the model
+    assert len(llm_model.calls) == 1
+    assert "first" in result["answer"]["echo"]
+
+
+def test_generate_answer_batch_api_bad_answers(llm_model):
+    node = make_node(llm_model, use_batch_api=True, batch_api_threshold=2)
+
+    def submit_batch(model, messages_list):
+        return [None, "not json at all", json.dumps({"echo": "third"})]
+
+    with patch("scrapegraphai.nodes.generate_answer_node.supports_batch_api", return_value=True), \
+            patch("scrapegraphai.nodes.generate_answer_node.submit_batch", submit_batch):
+        result = node.execute({"user_prompt": "What is the title?",
+                               "doc": ["first", "second", "third"]})
+
+    # the two bad answers are asked again one at a time, then merged
+    sent = sorted(call[-1].content for call in llm_model.calls[:-1])
+    assert sent == ["Content of 1:\nfirst", "Content of 2:\nsecond"]
+    assert "third" in result["answer"]["echo"]
@@ -0,0 +1,187 @@
+"""
+Provider batch test module
+"""
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+import pytest
+from langchain_core.messages import HumanMessage
+from langchain_openai import ChatOpenAI
+from scrapegraphai.utils.provider_batch import supports_batch_api, submit_batch
+
+
+@pytest.fixture
+def openai_model():
+    return ChatOpenAI(api_key="sk-test", model="gpt-4o-mini")
+
+
+def test_supports_batch_api(openai_model):
+    deepseek_like = ChatOpenAI(api_key="sk-test", base_url="https://api.deepseek.com/v1")
+
+    assert supports_batch_api(openai_model)
+    assert not supports_batch_api(deepseek_like)
+    assert not supports_batch_api(MagicMock())
+
+
+def test_submit_openai_batch(openai_model):
+    client = MagicMock()
+    client.batches.create.return_value = SimpleNamespace(id="batch_1", status="in_progress")
+    client.batches.retrieve.return_value = SimpleNamespace(id="batch_1", status="completed",
+                                                           output_file_id="file_out",
+                                                           error_file_id=None)
+    # answers come back out of order
+    lines = [
+        {"custom_id": str(i), "error": None,
+         "response": {"status_code": 200,
+                      "body": {"choices": [{"message": {"content": f"answer {i}"}}]}}}
+        for i in (1, 0)
+    ]
+    client.files.content.return_value = SimpleNamespace(
+        text="\n".join(json.dumps(line) for line in lines)
+    )
+
+    openai_model.root_client = client
+    answers = submit_batch(openai_model,
+                           [[HumanMessage("first")], [HumanMessage("second")]],
+                           poll_interval=0)
+
+    assert answers == ["answer 0", "answer 1"]
+    uploaded = client.files.create.call_args.kwargs["file"][1].decode().splitlines()
+    assert [json.loads(line)["body"]["messages"][0]["content"] for line in uploaded] == \
+        ["first", "second"]
+
+
+def test_submit_openai_batch_without_text(openai_model):
+    client = MagicMock()
+    client.batches.create.return_value = SimpleNamespace(id="batch_1", status="completed",
+                                                         output_file_id="file_out",
+                                                         error_file_id=None)
+    line = {"custom_id": "0", "error": None,
+            "response": {"status_code": 200,
+                         "body": {"choices": [{"message": {"content": None,
+                                                           "refusal": "I can't help"}}]}}}
+    client.files.content.return_value = SimpleNamespace(text=json.dumps(line))
+
+    openai_model.root_client = client
+    answers = submit_batch(openai_model, [[HumanMessage("first")]], poll_interval=0)
+
+    assert answers == [None]
+
+
+def test_submit_openai_batch_failed_requests(openai_model):
+    client = MagicMock()
+    client.batches.create.return_value = SimpleNamespace(id="batch_1", status="completed",
+                                                         output_file_id=None,
+                                                         error_file_id="file_err")
+    error = {"custom_id": "0", "error": None,
+             "response": {"status_code": 400,
+                          "body": {"error": {"message": "Invalid model name"}}}}
+    client.files.content.return_value = SimpleNamespace(text=json.dumps(error))
+
+    openai_model.root_client = client
+    with pytest.raises(RuntimeError, match="Invalid model name"):
+        submit_batch(openai_model, [[HumanMessage("first")]], poll_interval=0)
+
+    client.files.content.assert_called_once_with("file_err")
+
+
+def test_submit_anthropic_batch():
+    langchain_anthropic = pytest.importorskip("langchain_anthropic")
+    llm_model = langchain_anthropic.ChatAnthropic(api_key="sk-test",
+                                                  model="claude-3-haiku-20240307")
+    client = MagicMock()
+    client.messages.batches.create.return_value = SimpleNamespace(id="batch_1",
+                                                                  processing_status="in_progress")
+    client.messages.batches.retrieve.return_value = SimpleNamespace(id="batch_1",
+                                                                    processing_status="ended")
+    client.messages.batches.results.return_value = [
+        SimpleNamespace(custom_id=str(i), result=SimpleNamespace(
+            type="succeeded",
+            message=SimpleNamespace(content=[SimpleNamespace(type="text", text=f"answer {i}")])
+        ))
+        for i in (1, 0)
+    ]
+
+    with patch.object(type(llm_model), "_client", client):
+        answers = submit_batch(llm_model, [[HumanMessage("first")], [HumanMessage("second")]],
+                               poll_interval=0)
+
+    assert answers == ["answer 0", "answer 1"]
+    requests = client.messages.batches.create.call_args.kwargs["requests"]
+    assert [request["params"]["messages"][0]["content"] for request in requests] == \
+        ["first", "second"]
+
+
+def test_submit_batch_unsupported_model():
+    with pytest.raises(ValueError):
+        submit_batch(MagicMock(), [[HumanMessage("first")]])
+
+
+def test_supports_batch_api_without_anthropic_batches():
+    langchain_anthropic = pytest.importorskip("langchain_anthropic")
+    llm_model = langchain_anthropic.ChatAnthropic(api_key="sk-test",
+                                                  model="claude-3-haiku-20240307")
+    # anthropic SDKs before 0.40 have no client.messages.batches
+    client = SimpleNamespace(messages=SimpleNamespace(create=MagicMock()))
+
+    with patch.object(type(llm_model), "_client", client):
+        assert not supports_batch_api(llm_model)
+
+
+def test_submit_openai_batch_keeps_answers_of_failed_job(openai_model):
+    client = MagicMock()
+    client.batches.create.return_value = SimpleNamespace(id="batch_1", status="expired",
+                                                         output_file_id="file_out",
+                                                         error_file_id="file_err")
+    answer = {"custom_id": "0", "error": None,
+              "response": {"status_code": 200,
+                           "body": {"choices": [{"message": {"content": "answer 0"}}]}}}
+    error = {"custom_id": "1", "error": {"code": "batch_expired"}, "response": None}
+    client.files.content.side_effect = lambda file_id: SimpleNamespace(
+        text=json.dumps(answer if file_id == "file_out" else error)
+    )
+
+    openai_model.root_client = client
+    # the third prompt was never processed before the job expired
+    answers = submit_batch(openai_model,
+                           [[HumanMessage("first")], [HumanMessage("second")],
+                            [HumanMessage("third")]],
+                           poll_interval=0)
+
+    assert answers == ["answer 0", None, None]
+
+
+def test_submit_openai_batch_without_files(openai_model):
+    client = MagicMock()
+    client.batches.create.return_value = SimpleNamespace(id="batch_1", status="failed",
+                                                         output_file_id=None,
+                                                         error_file_id=None)
+
+    openai_model.root_client = client
+    with pytest.raises(RuntimeError, match="failed"):
+        submit_batch(openai_model, [[HumanMessage("first")]], poll_interval=0)
+
+
+def test_submit_anthropic_batch_keeps_answers_of_failed_requests():
+    langchain_anthropic = pytest.importorskip("langchain_anthropic")
+    llm_model = langchain_anthropic.ChatAnthropic(api_key="sk-test",
+                                                  model="claude-3-haiku-20240307")
+    client = MagicMock()
+    client.messages.batches.create.return_value = SimpleNamespace(id="batch_1",
+                                                                  processing_status="ended")
+    client.messages.batches.results.return_value = [
+        SimpleNamespace(custom_id="0", result=SimpleNamespace(
+            type="succeeded",
+            message=SimpleNamespace(content=[SimpleNamespace(type="text", text="answer 0")])
+        )),
+        SimpleNamespace(custom_id="1", result=SimpleNamespace(type="errored")),
+        SimpleNamespace(custom_id="2", result=SimpleNamespace(type="expired")),
+    ]
+
+    with patch.object(type(llm_model), "_client", client):
+        answers = submit_batch(llm_model,
+                               [[HumanMessage("first")], [HumanMessage("second")],
+                                [HumanMessage("third")]],
+                               poll_interval=0)
+
+    assert answers == ["answer 0", None, None]